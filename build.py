@@ -1,313 +1,970 @@
-#!/usr/bin/env python3
-import os, shutil, sys, time
-
-assert len(sys.argv) >= 1 and all(isinstance(arg, str) for arg in sys.argv)
-
-help_message = """
-build.py [-hrw] [long_flags]* [root_dir]?
-
-    default behaviour: builds from ./root_dir/src to ./root_dir/dst. the default
-    root_dir is the working directory.
-
-    -h, --help: print this message, then exit.
-
-    -w, --watch: after building, continuously monitor ./root_dir/src, and live-rebuild
-    into ./root_dir/dst when any files change. play a bell if any sub-commands fail.
-
-    -r, --release: emit the production version of react(-dom).js rather than
-    the development version, emit an empty file rather than live.js, minify .css and
-    .js outputs, and don't emit a .js.map file.
-
-    required command-line programs: google-closure-compiler, r.js.cmd, sass, tsc
-
-    build actions:
-
-        ./root_dir/dst/ is created if it doesn't exist, then cleared of all files
-
-        appropriate react, require.js and live.js sources are copied from
-        ./root_dir/resources/*.js to ./root_dir/dst/*.js
-
-        other ./root_dir/resources/* are copied unchanged to ./root_dir/dst/
-
-        ./root_dir/src/style.scss (and its imports) are compiled using sass, perhaps
-        minified, then saved to the single file ./root_dir/dst/style.css
-
-        ./root_dir/src/app.tsx (and its imports) are compiled using tsc, perhaps
-        minified, then saved to the single file ./root_dir/dst/app.js
-
-        ./root_dir/src/audioWorklet.ts is similarly compiled, bundled and minified
-"""
-
-# parse the command line, perhaps printing a help message
-is_release = False
-is_watch = False
-root_dir = "."
-
-if len(sys.argv) >= 2:
-    # parse flags
-    if sys.argv[-1].startswith("-"):
-        last_flag_i = len(sys.argv)
-    else:
-        last_flag_i = len(sys.argv) - 1
-
-    for raw_flag in sys.argv[1:last_flag_i]:
-        flags = []
-
-        if raw_flag.startswith("--"):
-            flags.append(raw_flag)
-        elif raw_flag.startswith("-"):
-            for ch in raw_flag[1:]:
-                if not ch in ["h", "w", "r"]:
-                    print(f"unrecognized short flag -{ch}")
-                    exit(1)
-
-                flags.append("-" + ch)
-        else:
-            print(f"flag '{raw_flag}' does not start with '-'")
-            exit(1)
-
-        for flag in flags:
-            if flag == "--release" or flag == "-r":
-                is_release = True
-            elif flag == "--watch" or flag == "-w":
-                is_watch = True
-            elif flag == "--help" or flag == "-h":
-                print(help_message)
-                exit(0)
-            else:
-                assert flag.startswith("--")
-                print(f"unrecognized long flag {flag}")
-
-    # parse the root_dir
-    if not sys.argv[-1].startswith("-"):
-        root_dir = os.path.join(".", sys.argv[-1])
-        if not os.path.isdir(root_dir):
-            print(f"'{root_dir}' is not a directory")
-            exit(1)
-
-src_dir = os.path.join(root_dir, "src")
-resources_dir = os.path.join(root_dir, "resources")
-dst_dir = os.path.join(root_dir, "dst")
-
-if not os.path.isdir(src_dir):
-    print(f"{src_dir} is not a directory")
-    exit(1)
-
-if not os.path.isdir(resources_dir):
-    print(f"{resources_dir} is not a directory")
-    exit(1)
-
-# delete and then recreate dst_dir
-if os.path.isdir(dst_dir):
-    shutil.rmtree(dst_dir)
-
-os.mkdir(dst_dir)
-
-# copy resource files directly to dst_dir
-def copy_resources():
-    for src_path in os.listdir(src_dir):
-        if src_path.endswith(".html"):
-            copy_src = os.path.join(src_dir, src_path)
-            copy_dst = os.path.join(dst_dir, os.path.basename(src_path))
-            shutil.copyfile(copy_src, copy_dst)
-
-    for resource_path in os.listdir(resources_dir):
-        if not resource_path.endswith(".js"):
-            copy_src = os.path.join(resources_dir, resource_path)
-            copy_dst = os.path.join(dst_dir, os.path.basename(resource_path))
-            shutil.copyfile(copy_src, copy_dst)
-
-copy_resources()
-
-# copy debug or release react sources to dst_dir. also, in release mode, write an empty file
-# to dst_dir/live.js. in non-release mode, copy live.js to dst_dir/live.js
-def copy_js_files():
-    react_suffix = "production.min" if is_release else "development"
-
-    shutil.copyfile(
-        os.path.join(resources_dir, f"react.{react_suffix}.js"),
-        os.path.join(dst_dir, "react.js"),
-    )
-    shutil.copyfile(
-        os.path.join(resources_dir, f"react-dom.{react_suffix}.js"),
-        os.path.join(dst_dir, "react-dom.js"),
-    )
-
-    shutil.copyfile(
-        os.path.join(resources_dir, "require.js"),
-        os.path.join(dst_dir, "require.js")
-    )
-
-    dst_live_js_path = os.path.join(dst_dir, "live.js")
-
-    if is_release:
-        open(dst_live_js_path, "a").close()
-    else:
-        shutil.copyfile(
-            os.path.join(resources_dir, "live.js"),
-            dst_live_js_path
-        )
-
-copy_js_files()
-
-# compile src_dir/style.scss to dst_dir/style.css
-def invoke_sass():
-    src_scss_path = os.path.join(src_dir, "style.scss")
-    dst_css_path = os.path.join(dst_dir, "style.css")
-
-    if os.path.isfile(src_scss_path):
-        sass_style_flag = "--style=compressed" if is_release else ""
-
-        result = os.system(
-            f"sass --no-source-map {sass_style_flag} {src_scss_path} {dst_css_path}"
-        )
-
-    return result
-
-invoke_sass()
-
-# compile src_dir/app.tsx (and its imports) to a temporary directory. (we deliberately
-# do this after updating html, css and resources, because it's the slowest step)
-def invoke_tsc():
-    tmp_dir = os.path.join(dst_dir, "tmp")
-    os.mkdir(tmp_dir)
-
-    src_tsx_path = os.path.join(src_dir, "app.tsx")
-    audio_worklet_ts_path = os.path.join(src_dir, "audioWorklet.ts")
-
-    source_map_flag = "" if is_release else "--sourceMap"
-    result = os.system(
-        "tsc --strict --target es6 --jsx react --module amd "
-        f"{source_map_flag} --esModuleInterop --removeComments --skipLibCheck "
-        f"{src_tsx_path} {audio_worklet_ts_path} --outDir {tmp_dir}"
-    )
-
-    # in release mode, minify and bundle the resulting source files
-    dst_app_js_path = os.path.join(dst_dir, "app.js")
-
-    if is_release:
-        # collate sources from many files to a single file (app only, not audioWorklet)
-        os.system(
-            f"r.js.cmd -o baseUrl={tmp_dir} name=app "
-            f"out={os.path.join(tmp_dir, 'app.collated.js')} "
-            f"paths.react=empty: paths.react-dom=empty: optimize=none logLevel=4 "
-        )
-
-        shutil.copy(
-            os.path.join(tmp_dir, "audioWorklet.js"),
-            os.path.join(tmp_dir, "audioWorklet.collated.js"),
-        )
-
-        for root_name in ["app", "audioWorklet"]:
-            # minify that single file
-            collated_path = os.path.join(tmp_dir, root_name + ".collated.js")
-            dst_path = os.path.join(dst_dir, root_name + ".js")
-
-            os.system(
-                f"google-closure-compiler --language_in ECMASCRIPT_2016 "
-                f"--language_out ECMASCRIPT_2016 "
-                f"--js {collated_path} --js_output_file {dst_path} "
-            )
-
-    # in non-release mode, just copy the resulting source files from tmp_dir to dst_dir
-    if not is_release:
-        for tmp_path in os.listdir(tmp_dir):
-            tmp_file_path = os.path.join(tmp_dir, tmp_path)
-            dst_file_path = os.path.join(dst_dir, tmp_path)
-
-            shutil.copy(tmp_file_path, dst_file_path)
-
-        assert os.path.isfile(dst_app_js_path)
-
-    # either way, clean up the tmp_dir
-    shutil.rmtree(tmp_dir)
-
-    return result
-
-invoke_tsc()
-
-# if we're in watch mode, monitor the src directory for changes (via inefficient, race-y
-# polling...), dispatching an appropriate rebuild command depending on the extension of
-# the modified file
-def build_fingerprint():
-    fingerprint = {}
-
-    for iter_dir in [src_dir, resources_dir]:
-        for filename in os.listdir(iter_dir):
-            full_path = os.path.join(iter_dir, filename)
-
-            if os.path.isdir(full_path):
-                print(f"subdirectories within {iter_dir} are not yet supported")
-                exit(1)
-
-            try:
-                mtime = os.stat(full_path).st_mtime_ns
-                fingerprint[full_path] = mtime
-            except FileNotFoundError:
-                # temporary files may have been deleted since the os.listdir() call 
-                None
-
-    return fingerprint
-
-if is_watch:
-    print("initial build complete. watching for changes...")
-
-    fingerprint = build_fingerprint()
-    try:
-        while True:
-            time.sleep(0.5)
-
-            # make a new fingerprint and diff it against the status quo
-            new_fingerprint = build_fingerprint()
-            if new_fingerprint == fingerprint:
-                continue
-
-            modified = []
-
-            for key in new_fingerprint.keys():
-                if not key in fingerprint or new_fingerprint[key] > fingerprint[key]:
-                    modified.append(key)
-
-            for key in fingerprint.keys():
-                if not key in new_fingerprint:
-                    modified.append(key)
-
-            fingerprint = new_fingerprint
-
-            # decide which operations to run depending on the modified file extensions...
-            css_modified = []
-            js_modified = []
-            resources_modified = []
-
-            for path in modified:
-                if path.endswith(".scss"):
-                    css_modified.append(path)
-                elif any(path.endswith(suffix) for suffix in [".tsx", ".ts", ".jsx", ".js"]):
-                    js_modified.append(path)
-                elif os.path.normpath(os.path.dirname(path)).endswith("resources"):
-                    resources_modified.append(path)
-                elif path.endswith(".html"):
-                    resources_modified.append(path)
-
-            # ...and then run them
-            if len(css_modified) > 0:
-                print(f"files changed: {css_modified}. re-running sass...")
-                if invoke_sass() != 0:
-                    print("\a", end="")
-                print("...sass complete")
-
-            if len(resources_modified) > 0:
-                print(f"files changed: {resources_modified}. copying resources to dst...")
-                copy_resources()
-                print("...copy complete")
-
-            if len(js_modified) > 0:
-                print(f"files changed: {js_modified}. re-running tsc...")
-                if invoke_tsc() != 0:
-                    print("\a", end="")
-                print("...tsc complete")
-
-    except KeyboardInterrupt:
-        print("keyboard interrupt received. closing...", end="")
-        exit(0)
-
+#!/usr/bin/env python3
+# time, like the other watch-only modules (threading, queue, signal, watchdog), is
+# imported inside the code paths that need it, so one-shot builds don't pay for it
+import argparse, concurrent.futures, hashlib, json, os, re, shutil, subprocess
+
+# parse the command line, perhaps printing a help message. argparse handles combined
+# short flags, exits with a message on unrecognized flags (which the old handwritten
+# parser silently ignored), and renders the flag documentation itself
+help_epilog = """
+required command-line programs: google-closure-compiler, r.js.cmd, sass, tsc
+
+build actions:
+
+    ./root_dir/dst/ is created if it doesn't exist. files which are already
+    up to date are left in place; files whose sources no longer exist are deleted
+
+    appropriate react, require.js and live.js sources are copied from
+    ./root_dir/resources/*.js to ./root_dir/dst/*.js
+
+    other ./root_dir/resources/* are copied unchanged to ./root_dir/dst/
+
+    ./root_dir/src/style.scss (and its imports) are compiled using sass, perhaps
+    minified, then saved to the single file ./root_dir/dst/style.css
+
+    ./root_dir/src/app.tsx (and its imports) are compiled using tsc, perhaps
+    minified, then saved to the single file ./root_dir/dst/app.js
+
+    ./root_dir/src/audioWorklet.ts is similarly compiled, bundled and minified
+"""
+
+parser = argparse.ArgumentParser(
+    prog="build.py",
+    description="builds from ./root_dir/src to ./root_dir/dst. the default root_dir "
+                "is the working directory.",
+    epilog=help_epilog,
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+)
+parser.add_argument(
+    "-w", "--watch", action="store_true",
+    help="after building, continuously monitor ./root_dir/src, and live-rebuild into "
+         "./root_dir/dst when any files change. play a bell if any sub-commands fail. "
+         "./root_dir/resources is assumed not to change while watching; on platforms "
+         "with SIGHUP, signal the process to re-copy resources without restarting.",
+)
+parser.add_argument(
+    "-r", "--release", action="store_true",
+    help="emit the production version of react(-dom).js rather than the development "
+         "version, emit an empty file rather than live.js, minify .css and .js "
+         "outputs, and don't emit a .js.map file.",
+)
+parser.add_argument("root_dir", nargs="?", default=".")
+
+args = parser.parse_args()
+
+is_release = args.release
+is_watch = args.watch
+root_dir = os.path.join(".", args.root_dir)
+
+if not os.path.isdir(root_dir):
+    print(f"'{root_dir}' is not a directory")
+    exit(1)
+
+# resolve each required command-line program to an absolute path once, up front.
+# invoking them directly (rather than via os.system) skips an intermediate shell
+# per command, and also avoids quoting problems when root_dir contains spaces
+SASS = shutil.which("sass")
+TSC = shutil.which("tsc")
+RJS = shutil.which("r.js.cmd") or shutil.which("r.js")
+GCC = shutil.which("google-closure-compiler")
+
+for program, resolved in [
+    ("sass", SASS), ("tsc", TSC), ("r.js", RJS), ("google-closure-compiler", GCC)
+]:
+    if resolved is None:
+        print(f"required command-line program '{program}' was not found on the PATH")
+        exit(1)
+
+src_dir = os.path.join(root_dir, "src")
+resources_dir = os.path.join(root_dir, "resources")
+dst_dir = os.path.join(root_dir, "dst")
+
+# cache_dir persists between builds (unlike dst_dir, which is wiped on startup). it
+# currently holds tsc's emitted files and its .tsbuildinfo, so that --incremental
+# can skip re-checking unmodified sources on the next build
+cache_dir = os.path.join(root_dir, ".build-cache")
+
+if not os.path.isdir(src_dir):
+    print(f"{src_dir} is not a directory")
+    exit(1)
+
+if not os.path.isdir(resources_dir):
+    print(f"{resources_dir} is not a directory")
+    exit(1)
+
+# create dst_dir if it doesn't already exist. (we deliberately don't wipe it: files
+# which are already up to date are skipped by copy_if_newer below, and anything stale
+# is cleaned up by remove_stale_outputs after the build)
+os.makedirs(dst_dir, exist_ok=True)
+
+# copy src to dst, unless dst already has src's exact modification time and size (in
+# which case it's assumed to be an up-to-date copy from a previous build). the copy
+# preserves src's mtime, so the comparison is exact rather than "newer than": this
+# keeps e.g. react.js correct when switching between -r and non-r builds, where the
+# mode's source file changes but its mtime may be older than the other mode's
+def copy_if_newer(copy_src, copy_dst):
+    try:
+        src_stat = os.stat(copy_src)
+        dst_stat = os.stat(copy_dst)
+
+        if (src_stat.st_mtime_ns, src_stat.st_size) == (dst_stat.st_mtime_ns, dst_stat.st_size):
+            return
+    except FileNotFoundError:
+        src_stat = os.stat(copy_src)
+
+    shutil.copyfile(copy_src, copy_dst)
+    os.utime(copy_dst, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+
+# a single os.scandir pass over iter_dir which both copies the files selected by
+# predicate into dst_dir and records every file's mtime, so callers interested in a
+# fingerprint of the directory don't need to read it a second time
+def scan_and_copy(iter_dir, predicate):
+    fingerprint = {}
+
+    with os.scandir(iter_dir) as entries:
+        for entry in entries:
+            try:
+                fingerprint[entry.path] = entry.stat().st_mtime_ns
+            except FileNotFoundError:
+                continue
+
+            if predicate(entry.name):
+                copy_if_newer(entry.path, os.path.join(dst_dir, entry.name))
+
+    return fingerprint
+
+# the fingerprint gathered during the most recent resources copy. resources_dir is
+# the larger and less volatile of the two input directories, so write_manifest reuses
+# this scan rather than reading the directory all over again
+resources_scan = {}
+
+# place src in dst_dir as a hard link rather than a copy, when the filesystem allows
+# it: linking is O(1) and writes no bytes regardless of file size, which matters for
+# the ~1MB react development build. only appropriate for files that are never
+# modified in place after the build (react, require.js, live.js). falls back to
+# copy_if_newer across filesystems or on platforms without hard links. (plain copies
+# are already cheap on linux - shutil.copyfile uses zero-userspace-buffer sendfile
+# there - so the fallback isn't a disaster)
+def link_or_copy(copy_src, copy_dst):
+    try:
+        src_stat = os.stat(copy_src)
+        dst_stat = os.stat(copy_dst)
+
+        # dst is already a hard link to src: nothing to do
+        if (src_stat.st_dev, src_stat.st_ino) == (dst_stat.st_dev, dst_stat.st_ino):
+            return
+
+        # os.link requires that the destination doesn't exist
+        os.remove(copy_dst)
+    except FileNotFoundError:
+        pass
+
+    try:
+        os.link(copy_src, copy_dst)
+    except OSError:
+        copy_if_newer(copy_src, copy_dst)
+
+# copy resource files directly to dst_dir
+def copy_resources():
+    scan_and_copy(src_dir, lambda name: name.endswith(".html"))
+
+    resources_scan.clear()
+    resources_scan.update(
+        scan_and_copy(resources_dir, lambda name: not name.endswith(".js"))
+    )
+
+# copy debug or release react sources to dst_dir. also, in release mode, write an empty file
+# to dst_dir/live.js. in non-release mode, copy live.js to dst_dir/live.js
+def copy_js_files():
+    react_suffix = "production.min" if is_release else "development"
+
+    link_or_copy(
+        os.path.join(resources_dir, f"react.{react_suffix}.js"),
+        os.path.join(dst_dir, "react.js"),
+    )
+    link_or_copy(
+        os.path.join(resources_dir, f"react-dom.{react_suffix}.js"),
+        os.path.join(dst_dir, "react-dom.js"),
+    )
+
+    link_or_copy(
+        os.path.join(resources_dir, "require.js"),
+        os.path.join(dst_dir, "require.js")
+    )
+
+    dst_live_js_path = os.path.join(dst_dir, "live.js")
+
+    if is_release:
+        # a previous non-release build leaves the real live.js here as a hard link
+        # to resources/live.js, so truncating it in place would destroy the vendored
+        # source. unlink first, then create a fresh empty file
+        try:
+            os.remove(dst_live_js_path)
+        except FileNotFoundError:
+            pass
+
+        open(dst_live_js_path, "w").close()
+    else:
+        link_or_copy(
+            os.path.join(resources_dir, "live.js"),
+            dst_live_js_path
+        )
+
+# resolve an @use/@import/@forward target to an actual .scss file, relative to the
+# stylesheet which references it. sass allows the extension and a leading underscore
+# (marking a partial) to be omitted, so try each candidate spelling in turn
+def resolve_scss_reference(referrer_path, target):
+    base_dir, name = os.path.split(os.path.join(os.path.dirname(referrer_path), target))
+
+    if name.endswith(".scss"):
+        candidates = [name, "_" + name]
+    else:
+        candidates = ["_" + name + ".scss", name + ".scss"]
+
+    for candidate in candidates:
+        candidate_path = os.path.join(base_dir, candidate)
+        if os.path.isfile(candidate_path):
+            return candidate_path
+
+    return None
+
+# hash the contents of a stylesheet and every .scss file it transitively references.
+# returns None when a reference can't be statically resolved (in which case the
+# caller shouldn't attempt to cache anything)
+def scss_digest(src_scss_path):
+    hasher = hashlib.sha256()
+    visited = set()
+    pending = [src_scss_path]
+
+    while len(pending) > 0:
+        path = pending.pop()
+        if path in visited:
+            continue
+        visited.add(path)
+
+        try:
+            with open(path, "rb") as f:
+                contents = f.read()
+        except FileNotFoundError:
+            return None
+
+        hasher.update(contents)
+        hasher.update(b"\0")
+
+        # @import permits a comma-separated list of targets, so take the whole
+        # statement up to its terminating ";" and pull out every quoted string in it
+        for statement in re.finditer(rb"""@(?:use|import|forward)\s+([^;]+)""", contents):
+            for match in re.finditer(rb"""["']([^"']+)["']""", statement.group(1)):
+                target = match.group(1).decode("utf-8", "replace")
+
+                # built-in modules like "sass:math" have no corresponding file
+                if target.startswith("sass:"):
+                    continue
+
+                resolved = resolve_scss_reference(path, target)
+                if resolved is None:
+                    return None
+
+                pending.append(resolved)
+
+    return hasher.hexdigest()
+
+# compile src_dir/style.scss to dst_dir/style.css. when no .scss file has actually
+# changed since the last successful run (e.g. the watch loop was triggered by an
+# edit which didn't alter the stylesheets), reuse the cached output rather than
+# paying for a sass subprocess
+def invoke_sass():
+    src_scss_path = os.path.join(src_dir, "style.scss")
+    dst_css_path = os.path.join(dst_dir, "style.css")
+
+    result = 0
+    if os.path.isfile(src_scss_path):
+        sass_cache_dir = os.path.join(cache_dir, "sass")
+        cached_css_path = os.path.join(
+            sass_cache_dir, "style.release.css" if is_release else "style.css"
+        )
+        digest_path = cached_css_path + ".digest"
+
+        digest = scss_digest(src_scss_path)
+
+        if digest is not None and os.path.isfile(cached_css_path):
+            try:
+                with open(digest_path) as f:
+                    cached_digest = f.read()
+            except FileNotFoundError:
+                cached_digest = None
+
+            if cached_digest == digest:
+                copy_if_newer(cached_css_path, dst_css_path)
+                return 0
+
+        sass_style_flags = ["--style=compressed"] if is_release else []
+
+        result = subprocess.run(
+            [SASS, "--no-source-map", *sass_style_flags, src_scss_path, dst_css_path]
+        ).returncode
+
+        if result == 0 and digest is not None:
+            os.makedirs(sass_cache_dir, exist_ok=True)
+            shutil.copyfile(dst_css_path, cached_css_path)
+            with open(digest_path, "w") as f:
+                f.write(digest)
+
+    return result
+
+# the npm distribution of google-closure-compiler can run a precompiled native image
+# (--platform native) instead of booting a jvm, which shaves a second or two of
+# startup from every invocation. not every installation understands the flag (e.g. a
+# bare java jar on the PATH), so probe it once with a --version run - which exercises
+# only the flag parser, not a compile - and settle on the flags for the whole
+# session. (probing up front, rather than inferring support from a compile's exit
+# code, keeps genuine compile errors from knocking us back to the jvm path; it also
+# makes the flags a plain constant, safe to read from the thread pool.) closure only
+# runs in release mode, so non-release builds skip the probe
+def probe_closure_platform_flags():
+    flags = ["--platform", "native"]
+
+    probe = subprocess.run(
+        [GCC, *flags, "--version"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    return flags if probe.returncode == 0 else []
+
+GCC_PLATFORM_FLAGS = probe_closure_platform_flags() if is_release else []
+
+def invoke_closure(src_js_path, dst_js_path):
+    return subprocess.run([
+        GCC, "--language_in", "ECMASCRIPT_2016",
+        "--language_out", "ECMASCRIPT_2016",
+        "--js", src_js_path, "--js_output_file", dst_js_path,
+        *GCC_PLATFORM_FLAGS,
+    ]).returncode
+
+# the two typescript entry points, each compiled (and, in release mode, bundled and
+# minified) independently of the other
+TS_ENTRY_POINTS = {
+    "app": "app.tsx",
+    "audioWorklet": "audioWorklet.ts",
+}
+
+# release and non-release builds use different compiler settings, so they keep
+# separate output directories (and therefore separate .tsbuildinfo files) to
+# avoid clobbering one another's incremental state
+def tsc_tmp_dir():
+    tmp_dir = os.path.join(cache_dir, "tsc-release" if is_release else "tsc-dev")
+    os.makedirs(tmp_dir, exist_ok=True)
+    return tmp_dir
+
+def write_tsconfig(root_name):
+    tmp_dir = tsc_tmp_dir()
+    entry_path = os.path.join(src_dir, TS_ENTRY_POINTS[root_name])
+
+    # drive tsc through a generated tsconfig rather than ad-hoc command-line flags:
+    # project invocations honour --incremental reliably, where bare-cli invocations
+    # are known to recompile from scratch. the tsconfig lives next to its outputs in
+    # tmp_dir, so its relative paths stay stable from build to build. each entry
+    # point gets its own tsconfig and .tsbuildinfo, so that a change to one entry's
+    # sources never forces the other entry to recompile
+    tsconfig = {
+        "compilerOptions": {
+            "strict": True,
+            "target": "es6",
+            "jsx": "react",
+            "module": "amd",
+            "sourceMap": not is_release,
+            "esModuleInterop": True,
+            "removeComments": True,
+            "skipLibCheck": True,
+            "incremental": True,
+            "tsBuildInfoFile": f"./{root_name}.tsbuildinfo",
+            # in non-release mode there's no bundling step, so tsc may as well emit
+            # straight into dst_dir rather than emitting into the cache and paying a
+            # full directory copy per build. release mode keeps its outputs in the
+            # cache, where r.js collates them
+            "outDir": "." if is_release else os.path.abspath(dst_dir),
+        },
+        "files": [os.path.abspath(entry_path)],
+    }
+
+    # only rewrite the tsconfig when its contents actually change, so that tsc never
+    # mistakes a byte-identical rewrite for a configuration change
+    tsconfig_path = os.path.join(tmp_dir, f"tsconfig.{root_name}.json")
+    tsconfig_json = json.dumps(tsconfig, indent=4)
+
+    try:
+        with open(tsconfig_path) as f:
+            tsconfig_unchanged = (f.read() == tsconfig_json)
+    except FileNotFoundError:
+        tsconfig_unchanged = False
+
+    if not tsconfig_unchanged:
+        with open(tsconfig_path, "w") as f:
+            f.write(tsconfig_json)
+
+    return tsconfig_path
+
+# compile one typescript entry point (and its imports): in release mode to a persistent
+# cache directory ready for bundling, in non-release mode directly to dst_dir
+def invoke_tsc_entry(root_name):
+    tmp_dir = tsc_tmp_dir()
+    tsconfig_path = write_tsconfig(root_name)
+
+    result = subprocess.run([TSC, "-p", tsconfig_path]).returncode
+
+    # in release mode, minify and bundle the resulting source files
+    if is_release:
+        dst_path = os.path.join(dst_dir, root_name + ".js")
+
+        if root_name == "app":
+            # collate sources from many files to a single file (app only: audioWorklet
+            # is a single module already, so closure reads tsc's output directly, with
+            # no intermediate file)
+            collated_path = os.path.join(tmp_dir, "app.collated.js")
+
+            subprocess.run([
+                RJS, "-o", f"baseUrl={tmp_dir}", "name=app",
+                f"out={collated_path}",
+                "paths.react=empty:", "paths.react-dom=empty:",
+                "optimize=none", "logLevel=4",
+            ])
+
+            minify_input_path = collated_path
+        else:
+            minify_input_path = os.path.join(tmp_dir, root_name + ".js")
+
+        # minify that single file - unless a previous build already minified
+        # byte-identical input. closure-compiler spawns a fresh jvm per invocation,
+        # which usually costs more than the minification itself, so cache its output
+        # content-addressed by a digest of its input
+        minified_cache_dir = os.path.join(cache_dir, "minified")
+
+        with open(minify_input_path, "rb") as f:
+            minify_input_digest = hashlib.sha256(f.read()).hexdigest()
+
+        cached_minified_path = os.path.join(
+            minified_cache_dir, minify_input_digest + ".js"
+        )
+
+        if os.path.isfile(cached_minified_path):
+            shutil.copyfile(cached_minified_path, dst_path)
+        else:
+            minify_result = invoke_closure(minify_input_path, dst_path)
+
+            if minify_result == 0 and os.path.isfile(dst_path):
+                os.makedirs(minified_cache_dir, exist_ok=True)
+                shutil.copyfile(dst_path, cached_minified_path)
+
+        # the collated intermediate is regenerated from scratch each build, so
+        # there's no reason to leave it in the cache directory
+        if root_name == "app":
+            os.remove(collated_path)
+
+    # in non-release mode, tsc has already emitted directly into dst_dir
+    if not is_release:
+        assert os.path.isfile(os.path.join(dst_dir, root_name + ".js"))
+
+    return result
+
+def invoke_tsc_app():
+    return invoke_tsc_entry("app")
+
+def invoke_tsc_worklet():
+    return invoke_tsc_entry("audioWorklet")
+
+# compile both entry points, as in a full build
+def invoke_tsc():
+    for result in [invoke_tsc_app(), invoke_tsc_worklet()]:
+        if result != 0:
+            return result
+
+    return 0
+
+# in non-release watch mode, rather than paying node startup, tsconfig parsing and
+# node_modules loading for every change, keep one long-lived `tsc --watch` subprocess
+# per entry point. tsc recompiles within its warm program state (typically hundreds of
+# milliseconds rather than seconds) and emits directly into dst_dir; a reader thread
+# reports each recompile as it finishes. when these processes are running, the watch
+# loop's own js branch stands down entirely
+tsc_watch_procs = []
+
+# per-entry-point status of the resident compilers, maintained by their reader
+# threads: the error count reported by the most recent completed compile, or None
+# while no compile has completed yet (or after the process dies)
+tsc_watch_errors = {}
+
+# set just before the resident compilers are deliberately terminated on shutdown, so
+# their reader threads don't misreport the resulting EOF as a crash
+tsc_watch_closing = False
+
+def start_tsc_watch():
+    import threading
+
+    first_builds = []
+
+    for root_name in TS_ENTRY_POINTS:
+        tsconfig_path = write_tsconfig(root_name)
+
+        proc = subprocess.Popen(
+            [TSC, "--watch", "--preserveWatchOutput", "-p", tsconfig_path],
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        tsc_watch_procs.append(proc)
+        tsc_watch_errors[root_name] = None
+
+        first_build = threading.Event()
+        first_builds.append(first_build)
+
+        # tsc prints "Found N errors. Watching for file changes." at the end of every
+        # (re)compile; treat that line as the completion signal. everything else on
+        # stdout is a diagnostic (file, line and message for each error), so echo it
+        # straight through to the terminal rather than swallowing it
+        def read_output(proc=proc, root_name=root_name, first_build=first_build):
+            for line in proc.stdout:
+                match = re.search(r"Found (\d+) error", line)
+                if match is None or "Watching for file changes" not in line:
+                    # tsc announces each recompile before emitting anything; clear
+                    # the entry's status so the compile counts as in flight until
+                    # its summary arrives
+                    if "File change detected" in line:
+                        tsc_watch_errors[root_name] = None
+
+                    print(line, end="")
+                    continue
+
+                errors = int(match.group(1))
+                tsc_watch_errors[root_name] = errors
+
+                if errors > 0:
+                    print("\a", end="")
+
+                if first_build.is_set():
+                    print(f"...tsc ({root_name}) rebuild complete")
+                else:
+                    first_build.set()
+
+            # stdout reached EOF, so the process has died (a crash, a broken node
+            # install, a deleted cache directory). record the failure and unblock
+            # the startup wait, rather than leaving the build hanging on it
+            if not tsc_watch_closing:
+                print(f"tsc --watch ({root_name}) exited unexpectedly")
+                tsc_watch_errors[root_name] = None
+                first_build.set()
+
+        threading.Thread(target=read_output, daemon=True).start()
+
+    # wait for each project's initial compile before reporting the build complete
+    for first_build in first_builds:
+        first_build.wait()
+
+    # mirror invoke_tsc's contract: report failure when any project's initial
+    # compile found errors, or its process died before completing one
+    if any(errors != 0 for errors in tsc_watch_errors.values()):
+        return 1
+
+    return 0
+
+# true when every resident compiler's most recent compile completed without errors
+# (vacuously true when none are running). the manifest must only be written in that
+# state: a recompile still in flight, or one that reported errors, means dst_dir
+# doesn't actually correspond to the input mtimes the manifest would record
+def tsc_watch_settled():
+    return all(errors == 0 for errors in tsc_watch_errors.values())
+
+# statically discover the set of source files an entry point transitively imports, by
+# scanning for import/export-from statements. only relative specifiers are followed:
+# bare module names (react, react-dom) resolve outside src_dir and can't affect a
+# rebuild. returns a set of absolute paths
+TS_IMPORT_REGEX = re.compile(
+    r"""^\s*(?:import|export)\s+(?:[^;"']*?\sfrom\s+)?["']([^"']+)["']""",
+    re.MULTILINE,
+)
+
+def ts_dependencies(root_name):
+    visited = set()
+    pending = [os.path.abspath(os.path.join(src_dir, TS_ENTRY_POINTS[root_name]))]
+
+    while len(pending) > 0:
+        path = pending.pop()
+        if path in visited:
+            continue
+        visited.add(path)
+
+        try:
+            with open(path) as f:
+                contents = f.read()
+        except (FileNotFoundError, UnicodeDecodeError):
+            continue
+
+        for target in TS_IMPORT_REGEX.findall(contents):
+            if not target.startswith("."):
+                continue
+
+            base = os.path.normpath(os.path.join(os.path.dirname(path), target))
+            for candidate in [base + ".ts", base + ".tsx", base + ".d.ts", base]:
+                if os.path.isfile(candidate):
+                    pending.append(candidate)
+                    break
+
+    return visited
+
+# snapshot the mtime of every file directly within the given directories. used both
+# to detect changes in the fallback polling watcher, and to decide whether anything
+# has changed since the manifest of the last successful build was written
+def build_fingerprint(iter_dirs):
+    fingerprint = {}
+
+    # os.scandir populates each entry's stat() and is_dir() from the directory read
+    # itself on linux and windows, so this is one syscall per directory rather than
+    # two per file
+    for iter_dir in iter_dirs:
+        with os.scandir(iter_dir) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    print(f"subdirectories within {iter_dir} are not yet supported")
+                    exit(1)
+
+                try:
+                    fingerprint[entry.path] = entry.stat().st_mtime_ns
+                except FileNotFoundError:
+                    # temporary files may have been deleted since the os.scandir() call
+                    None
+
+    return fingerprint
+
+# after each fully-successful build, a manifest recording every input file's mtime and
+# every output file's name is saved to the cache. on startup, a manifest which still
+# matches the current state of the tree means the whole initial build can be skipped
+manifest_path = os.path.join(cache_dir, "manifest.json")
+
+def write_manifest():
+    # reuse the resources fingerprint gathered while copying, if there is one. src_dir
+    # is always re-scanned: it's small, and it may well have changed since the build
+    # which triggered this manifest write began
+    if len(resources_scan) > 0:
+        inputs = dict(resources_scan)
+    else:
+        inputs = build_fingerprint([resources_dir])
+
+    inputs.update(build_fingerprint([src_dir]))
+
+    manifest = {
+        "release": is_release,
+        "inputs": inputs,
+        "outputs": sorted(os.listdir(dst_dir)),
+    }
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+
+def manifest_is_current():
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+
+    if manifest.get("release") != is_release:
+        return False
+
+    if manifest.get("inputs") != build_fingerprint([src_dir, resources_dir]):
+        return False
+
+    return all(
+        os.path.isfile(os.path.join(dst_dir, name))
+        for name in manifest.get("outputs", [])
+    )
+
+# now that dst_dir survives from build to build, files whose source has been deleted
+# would otherwise linger there forever. after each build, delete anything in dst_dir
+# that the current sources no longer account for
+def remove_stale_outputs():
+    expected = {"style.css", "react.js", "react-dom.js", "require.js", "live.js"}
+
+    for src_path in os.listdir(src_dir):
+        if src_path.endswith(".html"):
+            expected.add(src_path)
+
+    for resource_path in os.listdir(resources_dir):
+        if not resource_path.endswith(".js"):
+            expected.add(resource_path)
+
+    # in release mode, tsc's outputs are bundled to one file per entry point; in
+    # non-release mode, every module in each entry point's import graph is emitted
+    # into dst_dir as its own .js (+ .js.map) file
+    for root_name in TS_ENTRY_POINTS:
+        if is_release:
+            expected.add(root_name + ".js")
+        else:
+            for dep_path in ts_dependencies(root_name):
+                if dep_path.endswith(".d.ts"):
+                    continue
+
+                stem = os.path.splitext(os.path.basename(dep_path))[0]
+                expected.add(stem + ".js")
+                expected.add(stem + ".js.map")
+
+    for dst_path in os.listdir(dst_dir):
+        if dst_path not in expected:
+            os.remove(os.path.join(dst_dir, dst_path))
+
+# the file copies, sass and tsc have no data dependencies on one another, and each is
+# dominated by subprocess or disk i/o rather than python bytecode, so we fan them out
+# across a small thread pool. the wall-clock build time becomes roughly max(tsc, sass,
+# copies) rather than their sum - in practice, tsc dominates and the rest hide behind it
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+
+def run_parallel(*tasks):
+    # blocks until every task has finished, re-raising the first exception (if any)
+    futures = [executor.submit(task) for task in tasks]
+    return [future.result() for future in futures]
+
+# in non-release watch mode, the initial typescript compile is performed by the
+# long-lived `tsc --watch` processes, which then stay resident to serve rebuilds
+initial_tsc = start_tsc_watch if (is_watch and not is_release) else invoke_tsc
+
+# when the manifest shows that no input has changed since the last successful build
+# and every output is still present, skip the initial build outright - restarting a
+# watch session against an up-to-date tree then costs a stat pass rather than a full
+# build. (the resident tsc processes are still started in watch mode; their own
+# incremental check is quick when nothing has changed)
+if manifest_is_current():
+    print("build outputs are up to date")
+
+    if initial_tsc is start_tsc_watch:
+        start_tsc_watch()
+else:
+    results = run_parallel(copy_resources, copy_js_files, invoke_sass, initial_tsc)
+    remove_stale_outputs()
+
+    if all(result in [None, 0] for result in results):
+        write_manifest()
+
+# if we're in watch mode, monitor the src and resources directories for changes,
+# dispatching an appropriate rebuild command depending on the extension of each
+# modified file
+def dispatch_rebuild(modified):
+    # decide which operations to run depending on the modified file extensions...
+    css_modified = []
+    js_modified = []
+    resources_modified = []
+
+    for path in modified:
+        if path.endswith(".scss"):
+            css_modified.append(path)
+        elif any(path.endswith(suffix) for suffix in [".tsx", ".ts", ".jsx", ".js"]):
+            js_modified.append(path)
+        elif os.path.normpath(os.path.dirname(path)).endswith("resources"):
+            resources_modified.append(path)
+        elif path.endswith(".html"):
+            resources_modified.append(path)
+
+    # ...and then run them, overlapping independent steps on the pool
+    tasks = []
+
+    if len(css_modified) > 0:
+        print(f"files changed: {css_modified}. re-running sass...")
+        tasks.append(("sass", invoke_sass))
+
+    if len(resources_modified) > 0:
+        print(f"files changed: {resources_modified}. copying resources to dst...")
+        tasks.append(("copy", copy_resources))
+
+    if len(js_modified) > 0 and len(tsc_watch_procs) == 0:
+        # rebuild only the entry points whose import graph contains a modified file.
+        # anything the static scan can't account for (a freshly-created module that
+        # isn't imported yet, a changed resources/*.js) conservatively rebuilds both
+        modified_paths = {os.path.abspath(path) for path in js_modified}
+        entry_deps = {name: ts_dependencies(name) for name in TS_ENTRY_POINTS}
+        known_paths = set().union(*entry_deps.values())
+
+        unrecognized = not modified_paths <= known_paths
+        affected = [
+            name for name, deps in entry_deps.items()
+            if unrecognized or len(modified_paths & deps) > 0
+        ]
+
+        if len(affected) == len(TS_ENTRY_POINTS):
+            print(f"files changed: {js_modified}. re-running tsc...")
+            tasks.append(("tsc", invoke_tsc))
+        else:
+            for name in affected:
+                print(f"files changed: {js_modified}. re-running tsc ({name})...")
+                tasks.append(
+                    (f"tsc ({name})", invoke_tsc_app if name == "app" else invoke_tsc_worklet)
+                )
+
+    futures = [(name, executor.submit(task)) for (name, task) in tasks]
+    all_succeeded = True
+
+    for name, future in futures:
+        if future.result() not in [None, 0]:
+            print("\a", end="")
+            all_succeeded = False
+        print(f"...{name} complete")
+
+    if len(tasks) > 0:
+        remove_stale_outputs()
+
+        # a js change from the same debounce burst may still be compiling inside the
+        # resident tsc processes; tsc_watch_settled keeps the manifest from recording
+        # new .ts mtimes before their outputs are current (or while they have errors)
+        if all_succeeded and tsc_watch_settled():
+            write_manifest()
+
+# how long the watched directories must stay quiet before a rebuild is dispatched. a
+# single logical change often touches many files in quick succession (an editor's
+# write-tempfile-then-rename save, a git branch switch, a formatter run); absorbing
+# events until the burst subsides means each such change costs one rebuild, not many
+DEBOUNCE_SECONDS = 0.15
+
+# the preferred watch strategy: ask the os to notify us when a file changes (inotify on
+# linux, FSEvents on macos, ReadDirectoryChangesW on windows), via the optional
+# third-party watchdog library. the process sleeps in the kernel while idle, and a
+# rebuild starts within milliseconds of a save rather than up to half a second later
+def watch_with_events():
+    import queue
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+
+    events = queue.Queue()
+
+    class EnqueueEventHandler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            for path in [event.src_path, getattr(event, "dest_path", None)]:
+                if path:
+                    events.put(path)
+
+    observer = Observer()
+    handler = EnqueueEventHandler()
+    observer.schedule(handler, src_dir)
+    observer.start()
+
+    while True:
+        # block until something changes, then keep draining until the queue has been
+        # quiet for the debounce window
+        modified = {events.get()}
+        while True:
+            try:
+                modified.add(events.get(timeout=DEBOUNCE_SECONDS))
+            except queue.Empty:
+                break
+
+        dispatch_rebuild(sorted(modified))
+
+# the fallback watch strategy, for platforms where watchdog isn't installed: poll the
+# watched directories' mtimes every 500ms (inefficient and race-y, but dependency-free)
+def file_digest(path):
+    try:
+        with open(path, "rb") as f:
+            return hashlib.blake2b(f.read(), digest_size=16).digest()
+    except FileNotFoundError:
+        return None
+
+def watch_with_polling():
+    import time
+
+    # resources_dir isn't polled: it holds vendored files (react, require.js, live.js)
+    # which essentially never change mid-session, and scanning it every tick would
+    # roughly double the stat volume. SIGHUP triggers an explicit re-copy instead
+    fingerprint = build_fingerprint([src_dir])
+    content_hashes = {path: file_digest(path) for path in fingerprint}
+
+    # make a new fingerprint, diff it against the status quo, and return the files
+    # which genuinely changed. in the common nothing-changed case, a single dict
+    # equality comparison (one C-level loop, no sorting or hashing) short-circuits
+    # the whole diff; when they do differ, set algebra on the key views picks out
+    # the added, removed and touched paths without any per-key python loops. mtime
+    # is still only a pre-filter: editors and tools often rewrite a file without
+    # changing its contents (vim's :w with no edits, git checkout, format-on-save),
+    # so re-hash just the files whose mtime moved, and only treat a file as
+    # modified when its contents actually differ
+    def collect_modified():
+        nonlocal fingerprint
+
+        new_fingerprint = build_fingerprint([src_dir])
+        if new_fingerprint == fingerprint:
+            return []
+
+        added = new_fingerprint.keys() - fingerprint.keys()
+        removed = fingerprint.keys() - new_fingerprint.keys()
+        touched = {
+            key for key in new_fingerprint.keys() & fingerprint.keys()
+            if new_fingerprint[key] != fingerprint[key]
+        }
+
+        modified = []
+
+        for key in sorted(added | touched):
+            new_hash = file_digest(key)
+            if new_hash != content_hashes.get(key):
+                modified.append(key)
+            content_hashes[key] = new_hash
+
+        for key in sorted(removed):
+            modified.append(key)
+            content_hashes.pop(key, None)
+
+        fingerprint = new_fingerprint
+
+        return modified
+
+    while True:
+        time.sleep(0.5)
+
+        modified = collect_modified()
+        if len(modified) == 0:
+            continue
+
+        # keep absorbing further changes until the debounce window passes quietly, so
+        # that a burst of modifications straddling a poll tick still yields one rebuild
+        while True:
+            time.sleep(DEBOUNCE_SECONDS)
+
+            more_modified = collect_modified()
+            if len(more_modified) == 0:
+                break
+
+            modified.extend(more_modified)
+
+        dispatch_rebuild(list(dict.fromkeys(modified)))
+
+if is_watch:
+    print("initial build complete. watching for changes...")
+
+    # only src_dir is watched - resources_dir is vendored files that essentially never
+    # change during a dev session. where the platform supports it, SIGHUP requests a
+    # one-off resource re-copy without restarting the watcher
+    import signal
+
+    if hasattr(signal, "SIGHUP"):
+        def handle_sighup(signum, frame):
+            print("SIGHUP received. re-copying resources...")
+            copy_resources()
+            copy_js_files()
+            remove_stale_outputs()
+            print("...copy complete")
+
+        signal.signal(signal.SIGHUP, handle_sighup)
+
+    try:
+        import watchdog
+    except ImportError:
+        watchdog = None
+
+    try:
+        if watchdog is not None:
+            watch_with_events()
+        else:
+            watch_with_polling()
+    except KeyboardInterrupt:
+        print("keyboard interrupt received. closing...", end="")
+
+        tsc_watch_closing = True
+        for proc in tsc_watch_procs:
+            proc.terminate()
+
+        exit(0)
+